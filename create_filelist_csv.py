@@ -1,28 +1,78 @@
+import os
+import re
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, Iterator, List, Optional, Tuple
 import csv
 import pathspec
 
+from gitignore_match import compile_ignore_matcher
 
-def load_gitignore_specs(
+# .gitignore のパターンとして特別な意味を持つ文字（ディレクトリ名に含まれていたらエスケープする）
+_GLOB_SPECIAL_RE = re.compile(r"([\[\]*?\\])")
+
+# CSV 書き出し時のバッファサイズ
+CSV_WRITE_BUFFER_SIZE = 1 << 16
+
+
+def _rebase_gitignore_line(line: str, base: str) -> Optional[str]:
+    """
+    base ディレクトリ（ルートからの相対パス、posix 区切り）にある .gitignore の1行を、
+    ルートの .gitignore に書いた場合と同じ意味になるパターンに書き換える。
+
+    - "/" を含む（末尾の "/" を除く）パターンは base からの相対なので base/ を前に付ける
+    - "/" を含まないパターンは base 配下のどの階層にもマッチするので base/**/ を前に付ける
+    - 空行・コメント行は None（無視）
+    - base 自体はパターンではなくパスなので、"[" や "*" 等はエスケープしてから付ける
+    """
+    if not base:
+        return line
+    if not line.strip() or line.startswith("#"):
+        return None
+
+    base = _GLOB_SPECIAL_RE.sub(r"\\\1", base)
+    # 先頭の "!" / "#" は否定・コメントと解釈されないようにする
+    if base[0] in "!#":
+        base = f"\\{base}"
+
+    negate = line.startswith("!")
+    pattern = line[1:] if negate else line
+    # git は末尾の空白を無視するので、空白を除いてから末尾の "/" 以外に "/" があるか調べる
+    if "/" in pattern.rstrip().rstrip("/"):
+        rebased = f"{base}/{pattern.lstrip('/')}"
+    else:
+        rebased = f"{base}/**/{pattern}"
+    return f"!{rebased}" if negate else rebased
+
+
+def load_gitignore_spec(
     root_dir: Path, extra_gitignores: List[str]
-) -> Dict[Path, pathspec.PathSpec]:
+) -> pathspec.PathSpec:
     """
-    各 .gitignore / .git/info/exclude ごとに PathSpec を作成して返す。
+    .gitignore / .git/info/exclude をまとめて、ルートからの相対パスで判定する
+    1つの PathSpec を作成して返す。
 
     挙動:
     - ルート直下の .gitignore は root_dir に適用される
     - extra_gitignores に指定した .gitignore はその親ディレクトリ配下に適用される
+      （パターンはルートからの相対パターンに書き換えて合成する）
     - .git/info/exclude が存在すれば、必ず root_dir 全体に適用される（extra_gitignores に未指定でも読み込む）
+    - 後ろのパターンほど優先されるので、git と同じく
+      .git/info/exclude → ルートの .gitignore → 追加指定の .gitignore の順に並べる
     """
-    # まず生の行を集める（ディレクトリ -> List[str]）
-    raw_patterns: Dict[Path, List[str]] = {}
+    # まず生の行を集める（ベースディレクトリ, 行）
+    raw_patterns: List[Tuple[Path, List[str]]] = []
+
+    # 常に .git/info/exclude を読み込む（存在すれば root 全体に適用）
+    git_exclude = root_dir / ".git" / "info" / "exclude"
+    if git_exclude.exists():
+        lines = git_exclude.read_text(encoding="utf-8").splitlines()
+        raw_patterns.append((root_dir, lines))
 
     # ルート直下の .gitignore
     main_gitignore = root_dir / ".gitignore"
     if main_gitignore.exists():
         lines = main_gitignore.read_text(encoding="utf-8").splitlines()
-        raw_patterns.setdefault(root_dir, []).extend(lines)
+        raw_patterns.append((root_dir, lines))
 
     # 追加指定の .gitignore（相対パスで渡される想定）
     for rel_path in extra_gitignores:
@@ -31,71 +81,97 @@ def load_gitignore_specs(
             continue
         base_dir = gitignore_path.parent
         lines = gitignore_path.read_text(encoding="utf-8").splitlines()
-        raw_patterns.setdefault(base_dir, []).extend(lines)
+        raw_patterns.append((base_dir, lines))
 
-    # 常に .git/info/exclude を読み込む（存在すれば root 全体に適用）
-    git_exclude = root_dir / ".git" / "info" / "exclude"
-    if git_exclude.exists():
-        lines = git_exclude.read_text(encoding="utf-8").splitlines()
-        raw_patterns.setdefault(root_dir, []).extend(lines)
-
-    # 最後に PathSpec を作成して返す
-    specs: Dict[Path, pathspec.PathSpec] = {}
-    for base_dir, patterns in raw_patterns.items():
-        # pathspec は空行やコメント行も無視するのでそのまま渡して良い
-        specs[base_dir] = pathspec.PathSpec.from_lines("gitwildmatch", patterns)
+    # ルートからの相対パターンに揃えて、1つの PathSpec にする
+    patterns: List[str] = []
+    for base_dir, lines in raw_patterns:
+        base = base_dir.relative_to(root_dir).as_posix()
+        base = "" if base == "." else base
+        for line in lines:
+            rebased = _rebase_gitignore_line(line, base)
+            if rebased is not None:
+                patterns.append(rebased)
 
-    return specs
+    # pathspec は空行やコメント行も無視するのでそのまま渡して良い
+    return pathspec.PathSpec.from_lines("gitwildmatch", patterns)
 
 
-def is_ignored(
-    path: Path, root_dir: Path, specs: Dict[Path, pathspec.PathSpec]
-) -> bool:
+def _scandir_project_files(
+    root_dir: Path, is_ignored: Callable[[str], bool]
+) -> Iterator[os.DirEntry]:
     """
-    path がいずれかの .gitignore ルールで無視されるかどうかを判定
+    root_dir 配下の無視されないファイルを os.scandir で列挙する。
+
+    - DirEntry がキャッシュしている種別情報を使うので、エントリごとの stat() が不要
+    - .git ディレクトリと .gitignore で無視されるディレクトリには降りない
+    - シンボリックリンクのディレクトリには降りない（リンク先がファイルなら列挙する）
+
+    スタックには (ディレクトリパス, ルートからの相対プレフィックス) を積む。
+    相対パスは文字列結合で作るので、Path.relative_to や Path.parents は使わない。
     """
-    for base_dir, spec in specs.items():
-        # .gitignore が適用される範囲内であれば評価
-        if base_dir in path.parents or path == base_dir:
-            rel_from_base = path.relative_to(base_dir).as_posix()
-            if spec.match_file(rel_from_base):
-                return True
-    return False
+    stack: List[Tuple[str, str]] = [(str(root_dir), "")]
+
+    while stack:
+        dir_path, prefix = stack.pop()
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                name = entry.name
+                # .git はディレクトリでもファイル（サブモジュール・worktree の gitlink）でも除外。
+                # 降りる前に名前だけで弾くので、ファイルごとにパスを分解して調べる必要はない
+                if name == ".git":
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    # 末尾 "/" 付きで判定し、ディレクトリ専用パターンにもマッチさせる
+                    rel_dir = f"{prefix}{name}/"
+                    if is_ignored(rel_dir):
+                        continue
+                    stack.append((entry.path, rel_dir))
+                elif entry.is_file():
+                    if is_ignored(prefix + name):
+                        continue
+                    yield entry
 
 
 def get_all_project_files(root_dir: Path, extra_gitignores: List[str]) -> List[Path]:
     """
     .git 配下と .gitignore による除外を反映した全ファイル一覧を取得
     """
-    specs = load_gitignore_specs(root_dir, extra_gitignores)
-    result: List[Path] = []
-
-    for path in root_dir.rglob("*"):
-        if not path.is_file():
-            continue
-
-        # .git配下は除外
-        if any(part == ".git" for part in path.relative_to(root_dir).parts):
-            continue
-
-        if is_ignored(path, root_dir, specs):
-            continue
-
-        result.append(path)
-
-    return result
+    spec = load_gitignore_spec(root_dir, extra_gitignores)
+    is_ignored = compile_ignore_matcher(spec.patterns)
+    return [Path(entry.path) for entry in _scandir_project_files(root_dir, is_ignored)]
 
 
 def export_to_csv(files: List[Path], root_dir: Path, output_csv: Path) -> None:
     """
     取得したファイル一覧のプロジェクトルートからの相対パスを Windows パス区切りで CSV 出力する
+
+    行は走査順に依らないよう、ディレクトリ階層ごとに名前順（ツリーの行きがけ順）に並べる
     """
-    with output_csv.open("w", newline="", encoding="utf-8") as f:
+    # ルート配下のパスはプレフィックスを取り除くだけで相対パスになるので、
+    # ファイルごとに Path.relative_to を呼ばない
+    root_prefix = os.path.join(str(root_dir), "")
+    rel_paths: List[str] = []
+    for path in files:
+        path_str = str(path)
+        if path_str.startswith(root_prefix):
+            rel_path = path_str[len(root_prefix) :].replace(os.sep, "/")
+        else:
+            rel_path = path.relative_to(root_dir).as_posix()
+        rel_paths.append(rel_path)
+
+    # パスの要素（ディレクトリ名・ファイル名）のリストで比較して並べる。
+    # normcase で比較するので、Windows では大文字小文字を区別しない順になる
+    # （Windows では "/" も os.sep になる）
+    rel_paths.sort(key=lambda rel_path: os.path.normcase(rel_path).split(os.sep))
+    rows = [(rel_path.replace("/", "\\"),) for rel_path in rel_paths]
+
+    with output_csv.open(
+        "w", newline="", encoding="utf-8", buffering=CSV_WRITE_BUFFER_SIZE
+    ) as f:
         writer = csv.writer(f)
         writer.writerow(["relative_path"])
-        for path in files:
-            rel_path = path.relative_to(root_dir).as_posix().replace("/", "\\")
-            writer.writerow([rel_path])
+        writer.writerows(rows)
 
 
 def main() -> None:
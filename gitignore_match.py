@@ -0,0 +1,73 @@
+import re
+from typing import Callable, Iterable
+
+from pathspec import PathSpec, Pattern
+
+try:
+    import re2
+except ImportError:  # re2 が無ければ標準の re の連結正規表現で .gitignore を判定する
+    re2 = None
+
+# pathspec の各パターンの正規表現に含まれる名前付きグループ。
+# 連結すると同名グループの重複でコンパイルできないので、名前なしグループに置き換える
+_NAMED_GROUP_RE = re.compile(r"\(\?P<\w+>")
+
+
+def _pathspec_re2_matcher(patterns: list[Pattern]) -> Callable[[str], bool] | None:
+    """
+    re2 があり pathspec 1.x なら、pathspec の re2 バックエンド（RE2::Set）で
+    PathSpec.match_file を使う判定関数を返す。使えなければ None。
+    """
+    if re2 is None:
+        return None
+    try:
+        spec = PathSpec(patterns, backend="re2")
+    except TypeError:  # pathspec 0.12 には backend 引数が無い
+        return None
+    return spec.match_file
+
+
+def compile_ignore_matcher(patterns: Iterable[Pattern]) -> Callable[[str], bool]:
+    """
+    pathspec のパターン群を、連続する同じ種類（除外 / 否定 "!"）ごとに
+    1つの正規表現 (?:p1)|(?:p2)|... にまとめ、ルートからの相対パス
+    （ディレクトリは末尾 "/"）が無視対象かを判定する関数を返す。
+
+    gitignore は最後にマッチしたパターンが優先されるので、後ろの塊から順に調べ、
+    最初にマッチした塊の種類で結果を決める（PathSpec.match_file と同じ結果になる）。
+    パターン数ぶんの Python レベルのループが、塊の数ぶんの正規表現マッチになる。
+
+    re2 と pathspec 1.x があれば、より速い pathspec の re2 バックエンドにそのまま任せる
+    （re2 で連結正規表現を組むと、re より遅くなる）。
+    """
+    patterns = list(patterns)
+    re2_matcher = _pathspec_re2_matcher(patterns)
+    if re2_matcher is not None:
+        return re2_matcher
+
+    runs: list[tuple[bool, list[str]]] = []
+    for pattern in patterns:
+        if pattern.include is None or pattern.regex is None:
+            continue  # 空行・コメント行
+        source = _NAMED_GROUP_RE.sub("(?:", pattern.regex.pattern)
+        if runs and runs[-1][0] == pattern.include:
+            runs[-1][1].append(source)
+        else:
+            runs.append((pattern.include, [source]))
+
+    compiled = [
+        (
+            include,
+            re.compile("|".join(f"(?:{source})" for source in sources)).search,
+        )
+        for include, sources in reversed(runs)
+    ]
+
+    def matcher(rel_path: str) -> bool:
+        # pathspec と同じく search で判定する（1.x の "*/" などは先頭に固定されない）
+        for include, search in compiled:
+            if search(rel_path):
+                return include
+        return False
+
+    return matcher
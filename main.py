@@ -1,11 +1,25 @@
 import os
 import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
 from datetime import timezone, timedelta, datetime
 from pathlib import Path
-from typing import Any
-from pydriller import Repository
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
 from pathspec import PathSpec
-from pydriller.domain.commit import ModificationType
+
+from gitignore_match import compile_ignore_matcher
+
+try:
+    import orjson
+except ImportError:  # orjson が無ければ標準の json で書き出す
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack は履歴を別ファイルに書き出すときだけ必要
+    msgpack = None
 
 
 # ------------------------------------------------------------
@@ -23,15 +37,68 @@ LANGUAGE_MAP = {
     ".json": "JSON",
 }
 
+# LANGUAGE_MAP の拡張子 (str.endswith にまとめて渡せるようタプルにしておく)
+LANGUAGE_SUFFIXES = tuple(LANGUAGE_MAP)
+
+# git log --name-status の変更種別 -> 出力する change_type
+# 値は以前使っていた PyDriller の ModificationType の名前に合わせている。
+# 種別変更 "T"（ファイル -> シンボリックリンク等）は PyDriller と同じく
+# DELETE と ADD の2件として出力するので、ここには含めない
+CHANGE_TYPE_MAP = {
+    "A": "ADD",
+    "C": "COPY",
+    "D": "DELETE",
+    "M": "MODIFY",
+    "R": "RENAME",
+}
+
+# git log の出力フォーマット
+# レコード区切り RS (0x1e)、フィールド区切り US (0x1f)。
+# 本文 (%B) は改行を含むので、後ろにも US を置いて変更ファイル一覧と区切る
+GIT_LOG_FORMAT = "%x1e%H%x1f%at%x1f%ct%x1f%B%x1f"
+
+# JSON 書き出し時のバッファサイズ
+JSON_WRITE_BUFFER_SIZE = 1 << 16
+
 # JST タイムゾーン
 JST = timezone(timedelta(hours=9))
+JST_OFFSET_SECONDS = 9 * 60 * 60
+JST_OFFSET_STR = "+09:00"
+
+# ルートからの相対パス (ディレクトリは末尾 "/") を受け取り、無視対象なら True を返す関数
+IgnoreMatcher = Callable[[str], bool]
+
+
+class CommitInfo(NamedTuple):
+    """
+    コミット1件分の情報。同じコミットで変更された全ファイルの履歴で1つを共有する。
+    """
+
+    commit_hash: str  # 先頭14文字
+    message: str
+    author_ts: int
+    commit_ts: int
+
+
+# 収集中の履歴1件: (コミット情報, change_type, old_path, new_path)
+# ファイル数ぶん作られるので、生成の速い素のタプルにしておく。
+# 出力用の dict への変換は JSON 書き出し時まで遅らせる
+HistoryEntry = tuple[CommitInfo, str, str | None, str | None]
 
 
 # ------------------------------------------------------------
 # 言語判定
 # ------------------------------------------------------------
 def get_language_from_extension(filename: str) -> str | None:
-    return LANGUAGE_MAP.get(Path(filename).suffix, None)
+    # 対象の拡張子で終わらないファイル（大半のファイル）はここで打ち切る
+    if not filename.endswith(LANGUAGE_SUFFIXES):
+        return None
+    # Path(filename).suffix と同じ拡張子を、Path を作らずに文字列操作だけで取り出す
+    name = filename.rpartition("/")[2]
+    dot = name.rfind(".")
+    if dot <= 0:  # 拡張子なし、または ".gitignore" のようなドットファイル
+        return None
+    return LANGUAGE_MAP.get(name[dot:])
 
 
 # ------------------------------------------------------------
@@ -42,110 +109,299 @@ def load_gitignore(root_path: Path) -> PathSpec | None:
     ルートディレクトリ直下の .gitignore を読み込み、PathSpec を返す。
     """
     gitignore_path = root_path / ".gitignore"
-    if not gitignore_path.exists():
+    # 存在確認の stat を別にせず、1回で読み込む（無ければ None）
+    try:
+        lines = gitignore_path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
         return None
-    with gitignore_path.open("r", encoding="utf-8") as f:
-        spec = PathSpec.from_lines("gitwildmatch", f)
-    return spec
+    return PathSpec.from_lines("gitwildmatch", lines)
 
 
-def is_ignored(path: Path, spec: PathSpec | None, root_path: Path) -> bool:
-    """
-    .gitignore のルールに一致するか判定。
-    常に .git ディレクトリは除外する。
+def _is_dir_only_exclude(pattern: Any) -> bool:
+    # "node_modules/" のように末尾が "/" の除外パターン（否定 "!" は含めない）
+    return pattern.include is True and pattern.pattern.rstrip().endswith("/")
+
+
+def make_ignore_matcher(spec: PathSpec | None) -> IgnoreMatcher | None:
     """
-    if ".git" in path.relative_to(root_path).parts:
-        return True
+    PathSpec から判定関数を作る（判定自体は gitignore_match.compile_ignore_matcher）。
+    .gitignore が無い、または有効なパターンが無ければ None。
 
+    ファイルの判定ではディレクトリ専用の除外パターン（末尾 "/"）を除いておく。
+    これらがファイルのパスにマッチするのは祖先ディレクトリにマッチする場合だけで、
+    祖先が無視されていれば walk_project はそこに降りず、無視されていなければ
+    後ろの否定パターンがファイルにもマッチするので、ファイルの判定には影響しない。
+    """
     if spec is None:
-        return False
+        return None
+
+    if all(pattern.include is None for pattern in spec.patterns):
+        return None
 
-    rel_path = path.relative_to(root_path).as_posix()
-    return spec.match_file(rel_path)
+    dir_matcher = compile_ignore_matcher(spec.patterns)
+    file_matcher = compile_ignore_matcher(
+        pattern for pattern in spec.patterns if not _is_dir_only_exclude(pattern)
+    )
+
+    def matcher(rel_path: str) -> bool:
+        if rel_path[-1] == "/":
+            return dir_matcher(rel_path)
+        return file_matcher(rel_path)
+
+    return matcher
 
 
 # ------------------------------------------------------------
 # プロジェクト構造の探索
 # ------------------------------------------------------------
-def build_project_structure(
-    root_path: Path, current_path: Path = Path("."), spec: PathSpec | None = None
-) -> list[dict[str, Any]]:
+def _list_dir(
+    abs_path: str, rel_path: str, matcher: IgnoreMatcher | None
+) -> list[tuple[str, str, bool]]:
     """
-    プロジェクトのツリー構造を再帰的に構築。
-    .gitignore で無視されているものはスキップ。
+    ディレクトリ直下の (名前, 絶対パス, ディレクトリか) を名前順に返す。
+    .git と .gitignore で無視されるエントリは含めない。
+    シンボリックリンクは辿らず、ファイルとして扱う。
     """
-    abs_path = root_path / current_path
-    items: list[dict[str, Any]] = []
+    with os.scandir(abs_path) as it:
+        children = [
+            (entry.name, entry.path, entry.is_dir(follow_symlinks=False))
+            for entry in it
+            if entry.name != ".git"
+        ]
+
+    if matcher is not None:
+        # ディレクトリは末尾 "/" 付きで判定し、"node_modules/" のようなパターンにもマッチさせる
+        prefix = f"{rel_path}/" if rel_path else ""
+        children = [
+            child
+            for child in children
+            if not matcher(
+                f"{prefix}{child[0]}/" if child[2] else f"{prefix}{child[0]}"
+            )
+        ]
 
-    for entry in sorted(abs_path.iterdir()):
-        if is_ignored(entry, spec, root_path):
-            continue
+    # 名前（文字列）だけをキーにして並べる。以前の sorted(Path.iterdir()) と同じく
+    # normcase で比較するので、Windows では大文字小文字を区別しない順になる
+    children.sort(key=lambda child: os.path.normcase(child[0]))
+    return children
 
-        rel_path = entry.relative_to(root_path)
-        if entry.is_dir():
-            children = build_project_structure(root_path, rel_path, spec)
-            items.append(
-                {
-                    "type": "directory",
-                    "name": entry.name,
-                    "path": rel_path.as_posix(),
-                    "children": children,
-                }
-            )
-        else:
-            items.append(
-                {
-                    "type": "file",
-                    "name": entry.name,
-                    "path": rel_path.as_posix(),
-                }
-            )
 
-    return items
+def walk_project(
+    root_path: Path, matcher: IgnoreMatcher | None = None
+) -> Iterator[tuple[str, str, str]]:
+    """
+    プロジェクト配下を1回だけ走査し、(相対パス, 種別, 親ディレクトリの相対パス) を
+    行きがけ順に返す。種別は "directory" か "file"、ルート直下の親は ""。
+    再帰せずスタックで走査し、無視されたディレクトリには降りない。
+    """
+    stack = [("", iter(_list_dir(str(root_path), "", matcher)))]
+    while stack:
+        parent_rel, children = stack[-1]
+        for name, abs_path, is_dir in children:
+            rel_path = f"{parent_rel}/{name}" if parent_rel else name
+            if is_dir:
+                yield rel_path, "directory", parent_rel
+                stack.append((rel_path, iter(_list_dir(abs_path, rel_path, matcher))))
+                break
+            yield rel_path, "file", parent_rel
+        else:
+            stack.pop()
 
 
-def build_directories_list(
-    root_path: Path, spec: PathSpec | None = None
-) -> list[dict[str, Any]]:
-    directories: list[dict[str, Any]] = []
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        dirpath = Path(dirpath)
-        if is_ignored(dirpath, spec, root_path):
+def walk_git_tree(repo_path: Path, branch: str) -> Iterator[tuple[str, str, str]]:
+    """
+    ブランチにコミットされているツリーを git ls-tree で1回だけ読み、
+    walk_project と同じ (相対パス, 種別, 親ディレクトリの相対パス) を行きがけ順に返す。
+    作業ツリーを走査しないので stat 等のファイルシステムアクセスが無く、
+    コミットされたファイルだけが対象になるので .gitignore の判定も不要。
+    git のツリー順はディレクトリを "name/" として並べるので、walk_project と同じ
+    名前順になるようパスの要素のリストで並べ直す。
+    """
+    cmd = ["git", "-C", str(repo_path), "ls-tree", "-r", "-t", "-z", branch, "--"]
+    output = subprocess.run(
+        cmd,
+        stdout=subprocess.PIPE,
+        check=True,
+        encoding="utf-8",
+        errors="replace",
+    ).stdout
+
+    # 各レコードは "<mode> <type> <object>\t<path>"
+    entries: list[tuple[str, str, str]] = []
+    for record in output.split("\0"):
+        if not record:
             continue
+        info, _, rel_path = record.partition("\t")
+        object_type = info.split(" ", 2)[1]
+        # サブモジュール (commit) もディレクトリとして扱う
+        kind = "file" if object_type == "blob" else "directory"
+        entries.append((rel_path, kind, rel_path.rpartition("/")[0]))
 
-        rel_path = dirpath.relative_to(root_path)
-        rel_str = "" if rel_path.as_posix() == "." else rel_path.as_posix()
+    # 要素ごとの名前順 = 各ディレクトリの子を名前順に並べた行きがけ順。
+    # _list_dir と同じく normcase で比較する（Windows では "/" も os.sep になる）
+    entries.sort(key=lambda entry: os.path.normcase(entry[0]).split(os.sep))
+    yield from entries
 
-        children: list[str] = []
-        for d in dirnames:
-            full_d = dirpath / d
-            if not is_ignored(full_d, spec, root_path):
-                children.append(f"{(Path(rel_str) / d).as_posix()}/")
 
-        for f in filenames:
-            full_f = dirpath / f
-            if not is_ignored(full_f, spec, root_path):
-                children.append((Path(rel_str) / f).as_posix())
-
-        directories.append(
-            {
-                "relative_path": f"{rel_str}/" if rel_str else "./",
-                "children": children,
+def build_project_views(
+    entries: Iterable[tuple[str, str, str]],
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    walk_project / walk_git_tree の結果から、ツリー構造 (project_tree の structure) と
+    ディレクトリ一覧 (directories) を同時に組み立てる。
+    """
+    structure: list[dict[str, Any]] = []
+    directories: list[dict[str, Any]] = [{"relative_path": "./", "children": []}]
+
+    # 親ディレクトリの相対パス -> ツリーの children / ディレクトリ一覧の children
+    tree_children: dict[str, list[dict[str, Any]]] = {"": structure}
+    dir_children: dict[str, list[str]] = {"": directories[0]["children"]}
+
+    for rel_path, kind, parent_rel in entries:
+        name = rel_path.rpartition("/")[2]
+        if kind == "directory":
+            node: dict[str, Any] = {
+                "type": "directory",
+                "name": name,
+                "path": rel_path,
+                "children": [],
             }
-        )
-    return directories
+            tree_children[rel_path] = node["children"]
+            dir_children[parent_rel].append(f"{rel_path}/")
+            record: dict[str, Any] = {"relative_path": f"{rel_path}/", "children": []}
+            dir_children[rel_path] = record["children"]
+            directories.append(record)
+        else:
+            node = {"type": "file", "name": name, "path": rel_path}
+            dir_children[parent_rel].append(rel_path)
+        tree_children[parent_rel].append(node)
+
+    return structure, directories
 
 
 # ------------------------------------------------------------
-# Git 履歴の収集 (PyDriller)
+# Git 履歴の収集 (git log)
 # ------------------------------------------------------------
+def format_jst(timestamp: int) -> str:
+    """
+    UNIX タイムスタンプを JST の ISO 8601 文字列にする
+    (datetime.fromtimestamp(timestamp, JST).isoformat() と同じ結果)。
+    datetime を作らず整数のフォーマットだけで済ませる。
+    """
+    t = time.gmtime(timestamp + JST_OFFSET_SECONDS)
+    return (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}{JST_OFFSET_STR}"
+    )
+
+
+def _iter_git_log_records(
+    repo_path: Path, branch: str, from_date_utc: datetime | None = None
+) -> Iterator[str]:
+    """
+    git log を1回だけ起動し、出力をコミット単位のレコードに区切って順に返す。
+    コミットは古い順（git log --reverse の順。以前の PyDriller と同じ）。
+    出力はストリームで読むので、全体をメモリに載せない。
+    """
+    cmd = [
+        "git",
+        "-C",
+        str(repo_path),
+        "log",
+        "--reverse",
+        "--no-merges",  # マージコミットは変更ファイルが出ないので最初から出力させない
+        "-M",  # リネーム検出
+        "-z",  # パスをクォートせず NUL 区切りで出力
+        "--name-status",
+        f"--pretty=format:{GIT_LOG_FORMAT}",
+    ]
+    if from_date_utc is not None:
+        cmd.append(f"--since={from_date_utc.isoformat()}")
+    cmd += [branch, "--"]
+
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1 << 20,
+    ) as proc:
+        assert proc.stdout is not None
+        pending = ""
+        while chunk := proc.stdout.read(1 << 16):
+            records = (pending + chunk).split("\x1e")
+            pending = records.pop()
+            for record in records:
+                if record:
+                    yield record
+        if pending:
+            yield pending
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def iter_git_entries(
+    repo_path: Path, branch: str, from_date_utc: datetime | None = None
+) -> Iterator[tuple[str, HistoryEntry]]:
+    """
+    git log の出力を1件ずつ解析し、(解析対象パス, 履歴1件) を古いコミットから順に返す。
+    マージコミットは変更ファイルが無いので git log の段階で除外する（履歴には現れない）。
+    """
+    # 同じ本文のコミットメッセージは1つの文字列オブジェクトを共有する
+    msg_cache: dict[str, str] = {}
+
+    for record in _iter_git_log_records(repo_path, branch, from_date_utc):
+        commit_hash, author_ts, commit_ts, message, changes = record.split("\x1f")
+        message = message.strip()
+        message = msg_cache.setdefault(message, message)
+        commit = CommitInfo(commit_hash[:14], message, int(author_ts), int(commit_ts))
+
+        # 変更ファイル一覧: "<status>\0<path>\0" (リネーム・コピーは "<status>\0<old>\0<new>\0")
+        tokens = iter(changes.strip("\n\0").split("\0"))
+        for status in tokens:
+            if not status:
+                continue
+
+            # 種別変更は削除と追加の2件にする
+            if status[0] == "T":
+                path = sys.intern(next(tokens))
+                yield path, (commit, "DELETE", path, None)
+                yield path, (commit, "ADD", None, path)
+                continue
+
+            # 変更タイプ判定
+            change_type = CHANGE_TYPE_MAP.get(status[0], "UNKNOWN")
+
+            # ファイルパス情報（追加なら変更前、削除なら変更後のパスは無し）
+            # パスは何度も現れるので intern して、履歴全体で文字列を共有する
+            if status[0] in "RC":
+                old_path = sys.intern(next(tokens))
+                new_path = sys.intern(next(tokens))
+            else:
+                path = sys.intern(next(tokens))
+                old_path = None if change_type == "ADD" else path
+                new_path = None if change_type == "DELETE" else path
+
+            # 解析対象パス（削除されたファイルの場合は old_path を採用）
+            rel_path = new_path or old_path
+            if not rel_path:
+                continue
+
+            yield rel_path, (commit, change_type, old_path, new_path)
+
+
 def extract_git_history(
     repo_path: Path,
     branch: str,
     start_date_jst: datetime | None = None,
-) -> dict[str, list[dict[str, Any]]]:
+) -> dict[str, list[HistoryEntry]]:
     """
-    PyDrillerを使って、指定ブランチ全体の変更履歴をファイル単位で収集。
+    git log を使って、指定ブランチ全体の変更履歴をファイル単位で収集。
+    ファイルの並び ("files" の順) はそのファイルが最初に現れたコミットの順。
+    コミットは古い順に届くので、各ファイルの履歴は追加した時点でほぼ author date 順に
+    並んでいる。author date が前後するコミット（rebase・cherry-pick 等）がある場合だけ
+    並べ直す。
     """
 
     # 日付をUTCに変換
@@ -153,50 +409,192 @@ def extract_git_history(
     if start_date_jst is not None:
         from_date_utc = start_date_jst.astimezone(timezone.utc)
 
-    file_histories: dict[str, list[dict[str, Any]]] = {}
+    file_histories: defaultdict[str, list[HistoryEntry]] = defaultdict(list)
+    for rel_path, entry in iter_git_entries(repo_path, branch, from_date_utc):
+        file_histories[rel_path].append(entry)
 
-    for commit in Repository(
-        path_to_repo=repo_path.as_posix(),
-        only_in_branch=branch,
-        since=from_date_utc,  # JST→UTCに変換して渡す
-    ).traverse_commits():
-        for mod in getattr(
-            commit, "modified_files", getattr(commit, "modifications", [])
+    # author date 順（整数の比較）になっていない履歴だけソートする
+    for history in file_histories.values():
+        if any(
+            prev[0].author_ts > cur[0].author_ts
+            for prev, cur in zip(history, history[1:])
         ):
-            # ファイルパス情報
-            old_path = mod.old_path
-            new_path = mod.new_path
+            history.sort(key=lambda entry: entry[0].author_ts)
 
-            # 変更タイプ判定
-            change_type = mod.change_type
-            file_created = change_type == ModificationType.ADD
-            file_deleted = change_type == ModificationType.DELETE
-            file_rename = change_type == ModificationType.RENAME
+    return dict(file_histories)
 
-            # 解析対象パス（削除されたファイルの場合は old_path を採用）
-            rel_path = new_path or old_path
-            if not rel_path:
-                continue
 
-            entry = {
-                "commit_hash": commit.hash[:14],
-                "commit_message": commit.msg.strip(),
-                "author_date": commit.author_date.astimezone(JST).isoformat(),
-                "commit_date": commit.committer_date.astimezone(JST).isoformat(),
-                "change_type": change_type.name,
-                "file_created": file_created,
-                "file_deleted": file_deleted,
-                "file_rename": file_rename,
-                "old_file_name": old_path,
-                "new_file_name": new_path,
-            }
-            file_histories.setdefault(rel_path, []).append(entry)
+# ------------------------------------------------------------
+# JSON 書き出し
+# ------------------------------------------------------------
+def _dumps(obj: Any) -> bytes:
+    """
+    インデントなし・区切りの空白なしでエンコードする。
+    orjson の有無で出力が変わらないよう、json でも orjson と同じ区切り文字にする。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _dumps_pretty(obj: Any, level: int) -> bytes:
+    """
+    indent=4 で整形してエンコードする。level 段下げた位置に埋め込めるよう、
+    2行目以降の行頭にインデントを足す（文字列中の改行は \\n にエスケープ済み）。
+    """
+    text = json.dumps(obj, ensure_ascii=False, indent=4)
+    return text.replace("\n", "\n" + "    " * level).encode("utf-8")
+
+
+def history_entry_to_dict(
+    entry: HistoryEntry, commit_dates: dict[CommitInfo, tuple[str, str]]
+) -> dict[str, Any]:
+    """
+    収集時のタプルを、出力 JSON の "git_history" の要素 (dict) に変換する。
+    日付の文字列はコミットごとに1回だけ作り、commit_dates に入れて使い回す。
+    """
+    commit, change_type, old_path, new_path = entry
+    dates = commit_dates.get(commit)
+    if dates is None:
+        dates = commit_dates[commit] = (
+            format_jst(commit.author_ts),
+            format_jst(commit.commit_ts),
+        )
+    return {
+        "commit_hash": commit.commit_hash,
+        "commit_message": commit.message,
+        "author_date": dates[0],
+        "commit_date": dates[1],
+        "change_type": change_type,
+        "file_created": change_type == "ADD",
+        "file_deleted": change_type == "DELETE",
+        "file_rename": change_type == "RENAME",
+        "old_file_name": old_path,
+        "new_file_name": new_path,
+    }
+
+
+def iter_file_records(
+    git_history: dict[str, list[HistoryEntry]],
+) -> Iterator[dict[str, Any]]:
+    """
+    ファイルごとの履歴から、出力 JSON の "files" の要素を1件ずつ生成する。
+    履歴の dict はここで1ファイル分ずつ作るので、全件分を同時に保持しない。
+    """
+    # コミット -> (author_date, commit_date)。同じコミットの全ファイルで共有する
+    commit_dates: dict[CommitInfo, tuple[str, str]] = {}
+    for rel_path, history in git_history.items():
+        records = [history_entry_to_dict(entry, commit_dates) for entry in history]
+        created_at = records[0]["author_date"] if records else None
+        file_info: dict[str, Any] = {
+            "relative_path": rel_path,
+            "created_at": created_at,
+            "git_history": records,
+        }
+        lang = get_language_from_extension(rel_path)
+        if lang:
+            file_info["metadata"] = {"language": lang}
+        yield file_info
+
+
+def write_summary_json(
+    output_file: Path,
+    project_tree: dict[str, Any],
+    file_records: Iterable[dict[str, Any]],
+    directories_data: list[dict[str, Any]],
+    pretty: bool = False,
+    extra: dict[str, Any] | None = None,
+) -> None:
+    """
+    サマリー JSON を書き出す。
+    "files" は1件ずつエンコードして1行ずつ書くので、出力全体の dict や
+    エンコード結果をまとめてメモリに持たない。
+    pretty=True の場合は json.dump(..., indent=4) と同じ整形で書く（その分遅い）。
+    extra の各キーは "directories" の後ろにトップレベルのキーとして書く。
+    """
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if pretty:
+        _write_summary_json_pretty(
+            output_file, project_tree, file_records, directories_data, extra
+        )
+        return
+
+    with output_file.open("wb", buffering=JSON_WRITE_BUFFER_SIZE) as f:
+        f.write(b'{"project_tree":')
+        f.write(_dumps(project_tree))
+        f.write(b',\n"files":[')
+        for i, record in enumerate(file_records):
+            f.write(b"\n" if i == 0 else b",\n")
+            f.write(_dumps(record))
+        f.write(b'\n],\n"directories":')
+        f.write(_dumps(directories_data))
+        for key, value in (extra or {}).items():
+            f.write(b",\n" + _dumps(key) + b":")
+            f.write(_dumps(value))
+        f.write(b"}\n")
+
+
+def _write_summary_json_pretty(
+    output_file: Path,
+    project_tree: dict[str, Any],
+    file_records: Iterable[dict[str, Any]],
+    directories_data: list[dict[str, Any]],
+    extra: dict[str, Any] | None = None,
+) -> None:
+    """
+    write_summary_json の整形版。"files" は同じく1件ずつ書く。
+    """
+    with output_file.open("wb", buffering=JSON_WRITE_BUFFER_SIZE) as f:
+        f.write(b'{\n    "project_tree": ')
+        f.write(_dumps_pretty(project_tree, 1))
+        f.write(b',\n    "files": [')
+        empty = True
+        for record in file_records:
+            f.write(b"\n        " if empty else b",\n        ")
+            f.write(_dumps_pretty(record, 2))
+            empty = False
+        f.write(b"]" if empty else b"\n    ]")
+        f.write(b',\n    "directories": ')
+        f.write(_dumps_pretty(directories_data, 1))
+        for key, value in (extra or {}).items():
+            f.write(b",\n    " + _dumps_pretty(key, 1) + b": ")
+            f.write(_dumps_pretty(value, 1))
+        f.write(b"\n}")
+
+
+def split_history_to_msgpack(
+    file_records: Iterable[dict[str, Any]], history_file: Path, file_count: int
+) -> Iterator[dict[str, Any]]:
+    """
+    file_records から "git_history" を取り除いて順に返し、取り除いた履歴は
+    history_file に MessagePack で書き出す。
+    history_file の中身は {"relative_path", "git_history"} の map の配列 (file_count 件)。
+    JSON と同じく1ファイル分ずつ書くので、全件分の履歴をまとめてメモリに持たない。
+    msgpack の有無は呼び出し側が事前に確認しておくこと（generate_git_summary_json 参照）。
+    """
+    packer = msgpack.Packer(use_bin_type=True)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    with history_file.open("wb", buffering=JSON_WRITE_BUFFER_SIZE) as f:
+        f.write(packer.pack_array_header(file_count))
+        for record in file_records:
+            history = record.pop("git_history")
+            f.write(
+                packer.pack(
+                    {"relative_path": record["relative_path"], "git_history": history}
+                )
+            )
+            yield record
 
-    # コミット時刻でソート（古い順）
-    for rel_path in file_histories:
-        file_histories[rel_path].sort(key=lambda x: x["author_date"])
 
-    return file_histories
+def _path_from_json(path: Path, output_file: Path) -> str:
+    """
+    path を、JSON ファイル (output_file) のあるディレクトリからの相対パス (posix 区切り) にする。
+    相対パスにできない場合（Windows で別ドライブ等）は絶対パスにする。
+    """
+    try:
+        return Path(os.path.relpath(path, output_file.parent)).as_posix()
+    except ValueError:
+        return path.resolve().as_posix()
 
 
 # ------------------------------------------------------------
@@ -207,57 +605,71 @@ def generate_git_summary_json(
     branch: str,
     output_file: Path = Path("git_summary.json"),
     since: datetime | None = None,
+    use_branch_tree: bool = False,
+    pretty: bool = False,
+    history_file: Path | None = None,
 ) -> None:
+    """
+    use_branch_tree=True の場合、project_tree / directories を作業ツリーではなく
+    branch にコミットされているツリーから作る（ファイルシステムを走査しない）。
+    pretty=True の場合、JSON をインデント付きで書き出す。
+    history_file を指定した場合、各ファイルの git_history は JSON に含めず、
+    history_file に MessagePack で書き出す（JSON の "git_history_file" に、
+    JSON ファイルのあるディレクトリからの相対パスを記録）。
+    """
+    # 途中で失敗して既存の出力を壊さないよう、git log やファイル書き出しの前に確認する
+    if history_file is not None and msgpack is None:
+        raise ImportError("履歴を MessagePack で書き出すには msgpack が必要です")
+
     repo_path = repo_path.resolve()
     root_name = repo_path.name
 
     print(f"Analyzing repository: {root_name} (branch: {branch})")
 
-    # .gitignoreの読み込み
-    spec = load_gitignore(repo_path)
-    if spec:
-        print(f"Loaded .gitignore from {repo_path}")
+    # プロジェクトディレクトリの構造情報（ツリーとディレクトリ一覧を1回の走査で作る）
+    if use_branch_tree:
+        print(f"Reading project tree from branch {branch}")
+        entries = walk_git_tree(repo_path, branch)
     else:
-        print("No .gitignore found — analyzing all files.")
-
-    # プロジェクトディレクトリの構造情報
+        # .gitignoreの読み込み
+        spec = load_gitignore(repo_path)
+        if spec:
+            print(f"Loaded .gitignore from {repo_path}")
+        else:
+            print("No .gitignore found — analyzing all files.")
+        entries = walk_project(repo_path, make_ignore_matcher(spec))
+    structure, directories_data = build_project_views(entries)
     project_tree = {
         "root": {
             "name": root_name,
             "root_path": ".",
-            "structure": build_project_structure(repo_path, Path("."), spec),
+            "structure": structure,
         }
     }
 
     # Git履歴収集
     git_history = extract_git_history(repo_path, branch, since)
 
-    files_data: list[dict[str, Any]] = []
-    for rel_path, history in git_history.items():
-        created_at = history[0]["author_date"] if history else None
-        file_info: dict[str, Any] = {
-            "relative_path": rel_path,
-            "created_at": created_at,
-            "git_history": history,
-        }
-        lang = get_language_from_extension(rel_path)
-        if lang:
-            file_info["metadata"] = {"language": lang}
-        files_data.append(file_info)
-
-    directories_data = build_directories_list(repo_path, spec)
-
-    output = {
-        "project_tree": project_tree,
-        "files": files_data,
-        "directories": directories_data,
-    }
+    file_records = iter_file_records(git_history)
+    extra = None
+    if history_file is not None:
+        file_records = split_history_to_msgpack(
+            file_records, history_file, len(git_history)
+        )
+        extra = {"git_history_file": _path_from_json(history_file, output_file)}
 
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    with output_file.open("w", encoding="utf-8") as f:
-        json.dump(output, f, indent=4, ensure_ascii=False)
+    write_summary_json(
+        output_file,
+        project_tree,
+        file_records,
+        directories_data,
+        pretty=pretty,
+        extra=extra,
+    )
 
     print(f"JSON summary created: {output_file}")
+    if history_file is not None:
+        print(f"Git history written: {history_file}")
 
 
 # ------------------------------------------------------------